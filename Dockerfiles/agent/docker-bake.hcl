@@ -0,0 +1,51 @@
+# Build definition used by `inv agent.image-build`
+#
+# Both targets are solved in a single build graph, so the stages they share
+# are only evaluated once. Paths are relative to the root of the repository.
+
+variable "AGENT_TAG" {
+  default = "datadog/agent:master"
+}
+
+variable "AGENT_CACHE_TAG" {
+  default = "${AGENT_TAG}-cache"
+}
+
+# Folder holding the agent package and its name, defaults to the package
+# copied into the build context
+variable "DEB_DIR" {
+  default = "Dockerfiles/agent"
+}
+
+variable "DEB_FILE" {
+  default = "datadog-agent*_amd64.deb"
+}
+
+group "default" {
+  targets = ["testing", "release"]
+}
+
+target "_common" {
+  context    = "Dockerfiles/agent"
+  contexts   = {
+    deb = "${DEB_DIR}"
+  }
+  args       = {
+    DEB_FILE = "${DEB_FILE}"
+  }
+  cache-from = ["type=registry,ref=${AGENT_CACHE_TAG}"]
+}
+
+# Sanity checks on the image contents, nothing to export
+target "testing" {
+  inherits = ["_common"]
+  target   = "testing"
+  output   = ["type=cacheonly"]
+}
+
+target "release" {
+  inherits = ["_common"]
+  target   = "release"
+  tags     = ["${AGENT_TAG}"]
+  output   = ["type=docker"]
+}
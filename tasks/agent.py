@@ -2,26 +2,51 @@
 Agent namespaced tasks
 """
 from __future__ import print_function
-import glob
+import ctypes
+import fnmatch
+import hashlib
 import os
+import re
 import shutil
 import sys
-import platform
-from distutils.dir_util import copy_tree
+import threading
+from multiprocessing.pool import ThreadPool
+from subprocess import call
+
+try:
+    from shutil import which
+except ImportError:
+    from distutils.spawn import find_executable as which
 
 import invoke
 from invoke import task
 from invoke.exceptions import Exit
 
-from .utils import bin_name, get_build_flags, get_version_numeric_only, load_release_versions, get_version
-from .utils import REPO_PATH
-from .build_tags import get_build_tags, get_default_build_tags, LINUX_ONLY_TAGS, REDHAT_AND_DEBIAN_ONLY_TAGS, REDHAT_AND_DEBIAN_DIST
+from .utils import bin_name, get_build_flags, get_version_numeric_only, load_release_versions, get_version, get_go_version
+from .utils import REPO_PATH, copy_tree, is_up_to_date, makedirs, scandir
+from .build_tags import get_build_tags, get_default_build_tags, LINUX_ONLY_TAGS, REDHAT_AND_DEBIAN_ONLY_TAGS, REDHAT_AND_DEBIAN_DIST, DISTNAME
 from .go import deps
 from .docker import pull_base_images
 
 # constants
 BIN_PATH = os.path.join(".", "bin", "agent")
+DIST_PATH = os.path.join(BIN_PATH, "dist")
+# stamps are kept out of BIN_PATH, which omnibus ships as is
+STAMPS_PATH = os.path.join(".", ".stamps")
+BUILD_STAMP = os.path.join(STAMPS_PATH, "agent-build")
+ASSETS_STAMP = os.path.join(STAMPS_PATH, "agent-assets")
+GEMFILE_LOCK = os.path.join("omnibus", "Gemfile.lock")
+GEMFILE_STAMP = os.path.join("omnibus", ".Gemfile.hash")
+# gems the omnibus Gemfile takes from git branches: repository, environment
+# variable naming the branch and its default, as in the Gemfile
+OMNIBUS_GIT_GEMS = [
+    ("https://github.com/DataDog/omnibus-ruby.git", "OMNIBUS_RUBY_VERSION", "datadog-5.5.0"),
+    ("https://github.com/DataDog/omnibus-software.git", "OMNIBUS_SOFTWARE_VERSION", "master"),
+]
 AGENT_TAG = "datadog/agent:master"
+AGENT_CACHE_TAG = AGENT_TAG + "-cache"
+# BuildKit builder the agent image is built with
+AGENT_BUILDER = "datadog-agent"
 DEFAULT_BUILD_TAGS = [
     "apm",
     "consul",
@@ -44,6 +69,12 @@ DEFAULT_BUILD_TAGS = [
     "secrets",
 ]
 
+# with the default tags and no exclusion, the tags passed to go are always the same
+_DEFAULT_TAGS_JOINED = " ".join(DEFAULT_BUILD_TAGS)
+
+_BUILD_CMD_TMPL = "go build {race_opt} {build_type} -tags \"{go_build_tags}\" " \
+    "-o {agent_bin} -gcflags=\"{gcflags}\" -ldflags=\"{ldflags}\" " + REPO_PATH + "/cmd/agent"
+
 AGENT_CORECHECKS = [
     "containerd",
     "cpu",
@@ -73,53 +104,82 @@ PUPPY_CORECHECKS = [
     "uptime",
 ]
 
+# Windows resource embedded in the agent binary, and the files it's generated from
+WINDOWS_RESOURCE = "cmd/agent/rsrc.syso"
+WINDOWS_RESOURCE_STAMP = WINDOWS_RESOURCE + ".version"
+WINDOWS_RESOURCE_SOURCES = [
+    "cmd/agent/agent.rc",
+    "cmd/agent/agentmsg.mc",
+    "cmd/agent/agent.exe.manifest",
+    "cmd/agent/version.h",
+    "omnibus/resources/agent/msi/assets/project.ico",
+    "omnibus/resources/agent/msi/assets/project_16x16.ico",
+    "omnibus/resources/agent/msi/assets/project_32x32.ico",
+]
+
+# the files under these paths, with these extensions, are hashed to tell
+# whether the agent binary is up to date
+GO_SOURCES_PATHS = ["./cmd/agent", "./pkg", "./rtloader/include"]
+GO_SOURCES_EXTENSIONS = (".go", ".c", ".h", ".syso")
+
+# environment variables go and cgo read that change the agent binary
+GO_ENV_VARS = ["GOOS", "GOARCH", "CGO_ENABLED", "GOFLAGS", "CC"]
+
 @task
 def build(ctx, rebuild=False, race=False, build_include=None, build_exclude=None,
           puppy=False, development=True, precompile_only=False, skip_assets=False,
-          embedded_path=None, rtloader_root=None, python_home_2=None, python_home_3=None):
+          embedded_path=None, rtloader_root=None, python_home_2=None, python_home_3=None,
+          skip_if_unchanged=False):
     """
     Build the agent. If the bits to include in the build are not specified,
     the values from `invoke.yaml` will be used.
 
+    With --skip-if-unchanged, the go build step is skipped when neither the
+    sources nor the build options changed since the last build.
+
     Example invokation:
         inv agent.build --build-exclude=systemd
     """
 
+    default_tags = build_include is None
     build_include = DEFAULT_BUILD_TAGS if build_include is None else build_include.split(",")
     build_exclude = [] if build_exclude is None else build_exclude.split(",")
 
     ldflags, gcflags, env = get_build_flags(ctx, embedded_path=embedded_path,
             rtloader_root=rtloader_root, python_home_2=python_home_2, python_home_3=python_home_3)
 
+    build_exclude = set(build_exclude)
     if not sys.platform.startswith('linux'):
-        for ex in LINUX_ONLY_TAGS:
-            if ex not in build_exclude:
-                build_exclude.append(ex)
+        build_exclude |= LINUX_ONLY_TAGS
 
     # remove all tags that are only available on debian distributions
-    distname = platform.linux_distribution()[0].lower()
-    if distname not in REDHAT_AND_DEBIAN_DIST:
-        for ex in REDHAT_AND_DEBIAN_ONLY_TAGS:
-            if ex not in build_exclude:
-                build_exclude.append(ex)
+    if DISTNAME not in REDHAT_AND_DEBIAN_DIST:
+        build_exclude |= REDHAT_AND_DEBIAN_ONLY_TAGS
+    build_exclude = sorted(build_exclude)
 
     if sys.platform == 'win32':
         # This generates the manifest resource. The manifest resource is necessary for
         # being able to load the ancient C-runtime that comes along with Python 2.7
         # command = "rsrc -arch amd64 -manifest cmd/agent/agent.exe.manifest -o cmd/agent/rsrc.syso"
+        #
+        # Skipped when the resource is more recent than its sources and was
+        # generated for the current version
         ver = get_version_numeric_only(ctx)
-        build_maj, build_min, build_patch = ver.split(".")
-
-        command = "windmc --target pe-x86-64 -r cmd/agent cmd/agent/agentmsg.mc "
-        ctx.run(command, env=env)
-
-        command = "windres --define MAJ_VER={build_maj} --define MIN_VER={build_min} --define PATCH_VER={build_patch} ".format(
-            build_maj=build_maj,
-            build_min=build_min,
-            build_patch=build_patch
-        )
-        command += "-i cmd/agent/agent.rc --target=pe-x86-64 -O coff -o cmd/agent/rsrc.syso"
-        ctx.run(command, env=env)
+        if rebuild or not _resources_up_to_date(ver):
+            build_maj, build_min, build_patch = ver.split(".")
+
+            # both tools run in a single shell
+            command = "windmc --target pe-x86-64 -r cmd/agent cmd/agent/agentmsg.mc && "
+            command += "windres --define MAJ_VER={build_maj} --define MIN_VER={build_min} --define PATCH_VER={build_patch} ".format(
+                build_maj=build_maj,
+                build_min=build_min,
+                build_patch=build_patch
+            )
+            command += "-i cmd/agent/agent.rc --target=pe-x86-64 -O coff -o cmd/agent/rsrc.syso"
+            ctx.run(command, env=env)
+
+            with open(WINDOWS_RESOURCE_STAMP, "w") as f:
+                f.write(ver)
 
     if puppy:
         # Puppy mode overrides whatever passed through `--build-exclude` and `--build-include`
@@ -127,19 +187,34 @@ def build(ctx, rebuild=False, race=False, build_include=None, build_exclude=None
     else:
         build_tags = get_build_tags(build_include, build_exclude)
 
-    cmd = "go build {race_opt} {build_type} -tags \"{go_build_tags}\" "
+    # go >= 1.10 caches the compiled dependencies by itself, -i would only
+    # install them to $GOPATH/pkg on top of it
+    build_type = ""
+    if rebuild:
+        build_type = "-a"
+    elif precompile_only and not _go_has_build_cache():
+        build_type = "-i"
+
+    if default_tags and not puppy and not build_exclude:
+        go_build_tags = _DEFAULT_TAGS_JOINED
+    else:
+        go_build_tags = " ".join(build_tags)
 
-    cmd += "-o {agent_bin} -gcflags=\"{gcflags}\" -ldflags=\"{ldflags}\" {REPO_PATH}/cmd/agent"
     args = {
         "race_opt": "-race" if race else "",
-        "build_type": "-a" if rebuild else ("-i" if precompile_only else ""),
-        "go_build_tags": " ".join(build_tags),
+        "build_type": build_type,
+        "go_build_tags": go_build_tags,
         "agent_bin": os.path.join(BIN_PATH, bin_name("agent", android=False)),
         "gcflags": gcflags,
         "ldflags": ldflags,
-        "REPO_PATH": REPO_PATH,
     }
-    ctx.run(cmd.format(**args), env=env)
+
+    fingerprint = _build_fingerprint(build_tags, race, ldflags, gcflags, env)
+    if skip_if_unchanged and not rebuild and os.path.exists(args["agent_bin"]) \
+            and _read_stamp(BUILD_STAMP) == fingerprint:
+        print("Agent sources and build options are unchanged, skipping go build")
+    else:
+        ctx.run(_BUILD_CMD_TMPL.format(**args), env=env)
 
     # Render the configuration file template
     #
@@ -155,45 +230,222 @@ def build(ctx, rebuild=False, race=False, build_include=None, build_exclude=None
     if not skip_assets:
         refresh_assets(ctx, build_tags, development=development, puppy=puppy)
 
+    _write_stamp(BUILD_STAMP, fingerprint)
+
+
+def _build_fingerprint(build_tags, race, ldflags, gcflags, env):
+    """
+    Hash the path, mtime and size of the agent sources (including the rtloader
+    headers) along with the build options, the go version and the go settings
+    of the environment, so an up to date binary can be detected without
+    invoking go.
+    """
+    h = hashlib.sha1()
+    for option in (sorted(build_tags), race, ldflags, gcflags, sorted(env.items())):
+        h.update("{!r}\n".format(option).encode("utf-8"))
+
+    # the toolchain and the settings go reads from the environment
+    h.update("{}\n".format(get_go_version()).encode("utf-8"))
+    for var in GO_ENV_VARS:
+        h.update("{}={!r}\n".format(var, os.environ.get(var)).encode("utf-8"))
+
+    # vendored dependencies are pinned by the lock file
+    st = os.stat("Gopkg.lock")
+    h.update("Gopkg.lock {!r} {}\n".format(st.st_mtime, st.st_size).encode("utf-8"))
+
+    for entry in _build_sources(GO_SOURCES_PATHS):
+        st = entry.stat()
+        h.update("{} {!r} {}\n".format(entry.path, st.st_mtime, st.st_size).encode("utf-8"))
+
+    return h.hexdigest()
+
+
+def _build_sources(paths):
+    """
+    Yield the scandir entries of the files relevant to the go build found
+    under `paths`, in a stable order
+    """
+    for path in paths:
+        for entry in sorted(scandir(path), key=lambda e: e.name):
+            if entry.is_dir(follow_symlinks=False):
+                for source in _build_sources([entry.path]):
+                    yield source
+            elif entry.name.endswith(GO_SOURCES_EXTENSIONS):
+                yield entry
+
+
+def _go_has_build_cache():
+    """
+    Whether the go toolchain in use has a build cache (go >= 1.10)
+    """
+    match = re.search(r"go(\d+)\.(\d+)", get_go_version())
+    return match is None or (int(match.group(1)), int(match.group(2))) >= (1, 10)
+
+
+def _resources_up_to_date(version):
+    """
+    Whether the Windows resource of the agent was generated for `version` and
+    is more recent than its sources
+    """
+    if _read_stamp(WINDOWS_RESOURCE_STAMP) != version:
+        return False
+    try:
+        syso_mtime = os.stat(WINDOWS_RESOURCE).st_mtime
+    except OSError:
+        return False
+    return all(os.stat(src).st_mtime <= syso_mtime for src in WINDOWS_RESOURCE_SOURCES)
+
+
+def _read_stamp(path):
+    """
+    Return the fingerprint stored in the `path` stamp file, if any
+    """
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except IOError:
+        return None
+
+
+def _write_stamp(path, fingerprint):
+    """
+    Store `fingerprint` in the `path` stamp file
+    """
+    makedirs(os.path.dirname(path))
+    with open(path, "w") as f:
+        f.write(fingerprint)
+
+
 @task
 def refresh_assets(ctx, build_tags, development=True, puppy=False):
     """
-    Clean up and refresh Collector's assets and config files
+    Refresh Collector's assets and config files, files that are already up to
+    date are not copied again
     """
-    # ensure BIN_PATH exists
-    if not os.path.exists(BIN_PATH):
-        os.mkdir(BIN_PATH)
+    dist_folder = DIST_PATH
 
-    dist_folder = os.path.join(BIN_PATH, "dist")
-    if os.path.exists(dist_folder):
-        shutil.rmtree(dist_folder)
-    os.mkdir(dist_folder)
+    # files copied by a refresh with other options would linger in dist, start
+    # over when the options changed
+    options = "puppy={} python={} apm={} development={}".format(
+        puppy, "python" in build_tags, "apm" in build_tags, development)
+    if _read_stamp(ASSETS_STAMP) != options:
+        shutil.rmtree(dist_folder, ignore_errors=True)
+    makedirs(dist_folder)
 
     if "python" in build_tags:
-        copy_tree("./cmd/agent/dist/checks/", os.path.join(dist_folder, "checks"))
-        copy_tree("./cmd/agent/dist/utils/", os.path.join(dist_folder, "utils"))
-        shutil.copy("./cmd/agent/dist/config.py", os.path.join(dist_folder, "config.py"))
+        _fastcopy("./cmd/agent/dist/config.py", os.path.join(dist_folder, "config.py"))
     if not puppy:
-        shutil.copy("./cmd/agent/dist/dd-agent", os.path.join(dist_folder, "dd-agent"))
         # copy the dd-agent placeholder to the bin folder
-        bin_ddagent = os.path.join(BIN_PATH, "dd-agent")
-        shutil.move(os.path.join(dist_folder, "dd-agent"), bin_ddagent)
+        _fastcopy("./cmd/agent/dist/dd-agent", os.path.join(BIN_PATH, "dd-agent"))
 
     # System probe not supported on windows
     if sys.platform.startswith('linux'):
-      shutil.copy("./cmd/agent/dist/system-probe.yaml", os.path.join(dist_folder, "system-probe.yaml"))
-    shutil.copy("./cmd/agent/dist/datadog.yaml", os.path.join(dist_folder, "datadog.yaml"))
+      _fastcopy("./cmd/agent/dist/system-probe.yaml", os.path.join(dist_folder, "system-probe.yaml"))
+    _fastcopy("./cmd/agent/dist/datadog.yaml", os.path.join(dist_folder, "datadog.yaml"))
 
-    for check in AGENT_CORECHECKS if not puppy else PUPPY_CORECHECKS:
-        check_dir = os.path.join(dist_folder, "conf.d/{}.d/".format(check))
-        copy_tree("./cmd/agent/dist/conf.d/{}.d/".format(check), check_dir)
+    # folders to copy, the regular agent build always copies the same ones
+    if not puppy and "python" in build_tags:
+        copies = _DEFAULT_ASSET_COPIES
+    else:
+        copies = _asset_copies(build_tags, puppy)
+    if development:
+        copies = copies + [("./dev/dist/", dist_folder)]
+
+    # copies are I/O bound and independent from each other, run them concurrently
+    pool = ThreadPool(min(16, len(copies)))
+    try:
+        pool.map(lambda paths: _fast_copytree(*paths), copies)
+    finally:
+        pool.close()
+        pool.join()
+
+    # conf.d only exists once the checks configurations are copied
     if "apm" in build_tags:
-        shutil.copy("./cmd/agent/dist/conf.d/apm.yaml.default", os.path.join(dist_folder, "conf.d/apm.yaml.default"))
+        _fastcopy("./cmd/agent/dist/conf.d/apm.yaml.default", os.path.join(dist_folder, "conf.d/apm.yaml.default"))
 
-    copy_tree("./pkg/status/dist/", dist_folder)
-    copy_tree("./cmd/agent/gui/views", os.path.join(dist_folder, "views"))
-    if development:
-        copy_tree("./dev/dist/", dist_folder)
+    _write_stamp(ASSETS_STAMP, options)
+
+
+def _asset_copies(build_tags, puppy):
+    """
+    List the (source, destination) folders refresh_assets copies, they are all
+    written to disjoint locations
+    """
+    copies = []
+
+    if "python" in build_tags:
+        copies.append(("./cmd/agent/dist/checks/", os.path.join(DIST_PATH, "checks")))
+        copies.append(("./cmd/agent/dist/utils/", os.path.join(DIST_PATH, "utils")))
+
+    for check in AGENT_CORECHECKS if not puppy else PUPPY_CORECHECKS:
+        check_dir = os.path.join(DIST_PATH, "conf.d/{}.d/".format(check))
+        copies.append(("./cmd/agent/dist/conf.d/{}.d/".format(check), check_dir))
+
+    copies.append(("./pkg/status/dist/", DIST_PATH))
+    copies.append(("./cmd/agent/gui/views", os.path.join(DIST_PATH, "views")))
+    return copies
+
+# folders copied for the regular (non puppy, python enabled) agent, computed once
+_DEFAULT_ASSET_COPIES = _asset_copies(DEFAULT_BUILD_TAGS, puppy=False)
+
+
+def _fast_copytree(src, dst):
+    """
+    Copy the content of the `src` folder into `dst` using the native tool of
+    the platform (robocopy on Windows, rsync elsewhere) in a single process,
+    instead of walking the tree file by file from Python.
+
+    Falls back to an in-process copy when the tool can't be found.
+
+    The tool runs through subprocess rather than ctx.run: this is called from
+    several threads at once, and concurrent invoke runners each save and
+    restore the terminal mode, which can leave the terminal without echo.
+    """
+    makedirs(dst)
+
+    if sys.platform == 'win32' and which("robocopy"):
+        cmd = ["robocopy", "/E", "/NFL", "/NDL", "/NJH", "/NJS", "/NP", os.path.normpath(src), os.path.normpath(dst)]
+        # robocopy exit codes below 8 all mean success (1: files copied,
+        # 2: extra files found in the destination, etc.)
+        code = call(cmd)
+        if code >= 8:
+            raise Exit(message="robocopy {} {} failed".format(src, dst), code=code)
+    elif sys.platform != 'win32' and which("rsync"):
+        code = call(["rsync", "-a", src.rstrip("/") + "/", dst.rstrip("/") + "/"])
+        if code != 0:
+            raise Exit(message="rsync {} {} failed".format(src, dst), code=code)
+    else:
+        copy_tree(src, dst)
+
+
+def _fastcopy(src, dst):
+    """
+    Copy the `src` file to `dst` along with its mode and times, letting the
+    kernel move the data (sendfile on Linux, CopyFileEx on Windows) instead
+    of looping over Python buffers. Nothing is done if `dst` is up to date.
+    """
+    if is_up_to_date(os.stat(src), dst):
+        return
+
+    if sys.platform == 'win32':
+        copy_file_ex = ctypes.windll.kernel32.CopyFileExW
+        copy_file_ex.argtypes = [ctypes.c_wchar_p, ctypes.c_wchar_p, ctypes.c_void_p,
+                                 ctypes.c_void_p, ctypes.c_void_p, ctypes.c_uint32]
+        if not copy_file_ex(src, dst, None, None, None, 0):
+            raise ctypes.WinError()
+    elif sys.platform.startswith('linux') and hasattr(os, 'sendfile'):
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            size = os.fstat(fsrc.fileno()).st_size
+            offset = 0
+            while offset < size:
+                sent = os.sendfile(fdst.fileno(), fsrc.fileno(), offset, size - offset)
+                if sent == 0:
+                    break
+                offset += sent
+    else:
+        shutil.copyfile(src, dst)
+
+    shutil.copystat(src, dst)
 
 
 @task
@@ -206,7 +458,7 @@ def run(ctx, rebuild=False, race=False, build_include=None, build_exclude=None,
     passed. It accepts the same set of options as agent.build.
     """
     if not skip_build:
-        build(ctx, rebuild, race, build_include, build_exclude, puppy)
+        build(ctx, rebuild, race, build_include, build_exclude, puppy, skip_if_unchanged=True)
 
     ctx.run(os.path.join(BIN_PATH, bin_name("agent")))
 
@@ -220,31 +472,76 @@ def system_tests(ctx):
 
 
 @task
-def image_build(ctx, base_dir="omnibus", skip_tests=False):
+def image_build(ctx, base_dir="omnibus", skip_tests=False, push_cache=False):
     """
     Build the docker image
+
+    The build runs in a dedicated BuildKit builder using the docker-container
+    driver (created on the first run), as the default docker driver can't
+    import or export registry caches. Unchanged layers are pulled from the
+    cache stored in the registry, pass --push-cache to update it (requires
+    push access to the repository).
+
+    The builder container pulls images by itself, bypassing the daemon's
+    content trust: base images are pinned to the digests the signed pull
+    resolved instead.
     """
     base_dir = base_dir or os.environ.get("OMNIBUS_BASE_DIR")
     pkg_dir = os.path.join(base_dir, 'pkg')
-    list_of_files = glob.glob(os.path.join(pkg_dir, 'datadog-agent*_amd64.deb'))
+    packages = []
+    if os.path.isdir(pkg_dir):
+        packages = [e for e in scandir(pkg_dir) if fnmatch.fnmatch(e.name, 'datadog-agent*_amd64.deb')]
     # get the last debian package built
-    if not list_of_files:
+    if not packages:
         print("No debian package build found in {}".format(pkg_dir))
         print("See agent.omnibus-build")
         raise Exit(code=1)
-    latest_file = max(list_of_files, key=os.path.getctime)
-    shutil.copy2(latest_file, "Dockerfiles/agent/")
+    latest_file = max(packages, key=lambda e: e.stat().st_ctime).path
 
     # Pull base image with content trust enabled
-    pull_base_images(ctx, "Dockerfiles/agent/Dockerfile", signed_pull=True)
+    base_images = pull_base_images(ctx, "Dockerfiles/agent/Dockerfile", signed_pull=True)
+
+    # Make the builder use the verified images, by digest
+    pinned_images = []
+    for image in sorted(base_images):
+        digest = ctx.run("docker inspect --format '{{index .RepoDigests 0}}' " + image, hide=True).stdout.strip()
+        pinned_images.append("--set '*.contexts.{}=docker-image://{}'".format(image, digest))
+
+    _ensure_image_builder(ctx)
 
-    # Build with the testing target
-    if not skip_tests:
-        ctx.run("docker build -t {} --target testing Dockerfiles/agent".format(AGENT_TAG))
+    # Build the testing and release targets in one go, see the bake file
+    cmd = "docker buildx bake --builder {builder} -f Dockerfiles/agent/docker-bake.hcl {pinned_images} {cache_opts} {targets}"
+    args = {
+        "builder": AGENT_BUILDER,
+        "pinned_images": " ".join(pinned_images),
+        "cache_opts": "",
+        "targets": "release" if skip_tests else "testing release",
+    }
+    env = {
+        "DOCKER_BUILDKIT": "1",
+        "AGENT_TAG": AGENT_TAG,
+        "AGENT_CACHE_TAG": AGENT_CACHE_TAG,
+        # the package is read from where it was built rather than copied
+        # into the build context
+        "DEB_DIR": os.path.abspath(os.path.dirname(latest_file)),
+        "DEB_FILE": os.path.basename(latest_file),
+    }
+
+    # Only the release layers are exported to the cache as the testing target
+    # just runs sanity checks on top of it
+    if push_cache:
+        args["cache_opts"] = "--set release.cache-to=type=registry,ref={},mode=max".format(AGENT_CACHE_TAG)
+    ctx.run(cmd.format(**args), env=env)
+
+
+def _ensure_image_builder(ctx):
+    """
+    Create the docker-container BuildKit builder image_build runs in, unless
+    it already exists
+    """
+    if ctx.run("docker buildx inspect {}".format(AGENT_BUILDER), warn=True, hide=True).failed:
+        ctx.run("docker buildx create --name {} --driver docker-container".format(AGENT_BUILDER))
 
-    # Build with the release target
-    ctx.run("docker build -t {} --target release Dockerfiles/agent".format(AGENT_TAG))
-    ctx.run("rm Dockerfiles/agent/datadog-agent*_amd64.deb")
 
 @task
 def integration_tests(ctx, install_deps=False, race=False, remote_docker=False):
@@ -272,8 +569,8 @@ def integration_tests(ctx, install_deps=False, race=False, remote_docker=False):
         "./test/integration/util/kubelet/...",
     ]
 
-    for prefix in prefixes:
-        ctx.run("{} {}".format(go_cmd, prefix))
+    # a single go test invocation builds and runs all the packages concurrently
+    ctx.run("{} {}".format(go_cmd, " ".join(prefixes)))
 
 
 @task(help={'skip-sign': "On macOS, use this option to build an unsigned package if you don't have Datadog's developer keys."})
@@ -298,17 +595,30 @@ def omnibus_build(ctx, puppy=False, log_level="info", base_dir=None, gem_path=No
         overrides_cmd = "--override=" + " ".join(overrides)
 
     with ctx.cd("omnibus"):
-        # make sure bundle install starts from a clean state
-        try:
-            os.remove("Gemfile.lock")
-        except Exception:
-            pass
-
         env = load_release_versions(ctx, release_version)
-        cmd = "bundle install"
+
+        # bundle install only runs again when the Gemfile, its inputs or the
+        # heads of the git branches it uses changed, or when installed gems
+        # went missing (bundle check doesn't hit the network)
+        fingerprint = _bundle_fingerprint(ctx, gem_path, env)
+        check_cmd = "bundle check"
         if gem_path:
-            cmd += " --path {}".format(gem_path)
-        ctx.run(cmd, env=env)
+            check_cmd += " --path {}".format(gem_path)
+        if fingerprint is None or not os.path.exists(GEMFILE_LOCK) or _read_stamp(GEMFILE_STAMP) != fingerprint \
+                or ctx.run(check_cmd, env=env, warn=True, hide=True).failed:
+            # make sure bundle install starts from a clean state
+            try:
+                os.remove(GEMFILE_LOCK)
+            except Exception:
+                pass
+
+            cmd = "bundle install"
+            if gem_path:
+                cmd += " --path {}".format(gem_path)
+            ctx.run(cmd, env=env)
+
+            with open(GEMFILE_STAMP, "w") as f:
+                f.write(fingerprint)
 
         omnibus = "bundle exec omnibus.bat" if sys.platform == 'win32' else "bundle exec omnibus"
         cmd = "{omnibus} build {project_name} --log-level={log_level} {populate_s3_cache} {overrides}"
@@ -327,18 +637,43 @@ def omnibus_build(ctx, puppy=False, log_level="info", base_dir=None, gem_path=No
         ctx.run(cmd.format(**args), env=env)
 
 
+def _bundle_fingerprint(ctx, gem_path, env):
+    """
+    Hash the omnibus Gemfile along with the bundle options, the release
+    versions it reads from the environment and the commits its git gems
+    currently point to. Returns None when the commits can't be resolved.
+    """
+    h = hashlib.sha1()
+    with open(os.path.join("omnibus", "Gemfile"), "rb") as f:
+        h.update(f.read())
+    h.update("{!r} {!r}".format(gem_path, sorted(env.items())).encode("utf-8"))
+
+    for repo, var, default in OMNIBUS_GIT_GEMS:
+        branch = env.get(var) or os.environ.get(var) or default
+        res = ctx.run("git ls-remote {} {}".format(repo, branch), warn=True, hide=True)
+        if res.failed or not res.stdout.strip():
+            return None
+        h.update(res.stdout.encode("utf-8"))
+
+    return h.hexdigest()
+
+
 @task
 def clean(ctx):
     """
     Remove temporary objects and binary artifacts
     """
+    # remove the bin/agent folder, in the background as it doesn't depend on go clean
+    print("Remove agent binary folder")
+    rm_bin = threading.Thread(target=shutil.rmtree, args=(BIN_PATH,), kwargs={"ignore_errors": True})
+    rm_bin.start()
+
     # go clean
     print("Executing go clean")
-    ctx.run("go clean")
-
-    # remove the bin/agent folder
-    print("Remove agent binary folder")
-    ctx.run("rm -rf ./bin/agent")
+    try:
+        ctx.run("go clean")
+    finally:
+        rm_bin.join()
 
 
 @task
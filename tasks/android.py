@@ -7,8 +7,6 @@ import yaml
 import os
 import shutil
 import sys
-import platform
-from distutils.dir_util import copy_tree
 
 import invoke
 from invoke import task
@@ -16,7 +14,7 @@ from invoke.exceptions import Exit
 
 from .utils import bin_name, get_build_flags, get_version_numeric_only, load_release_versions, get_version
 from .utils import REPO_PATH
-from .build_tags import get_build_tags, get_default_build_tags, LINUX_ONLY_TAGS, REDHAT_AND_DEBIAN_ONLY_TAGS, REDHAT_AND_DEBIAN_DIST
+from .build_tags import get_build_tags, get_default_build_tags, LINUX_ONLY_TAGS, REDHAT_AND_DEBIAN_ONLY_TAGS, REDHAT_AND_DEBIAN_DIST, DISTNAME
 from .go import deps
 
 # constants
@@ -62,8 +60,7 @@ def build(ctx, rebuild=False, race=False, build_include=None, build_exclude=None
                 build_exclude.append(ex)
 
     # remove all tags that are only available on debian distributions
-    distname = platform.linux_distribution()[0].lower()
-    if distname not in REDHAT_AND_DEBIAN_DIST:
+    if DISTNAME not in REDHAT_AND_DEBIAN_DIST:
         for ex in REDHAT_AND_DEBIAN_ONLY_TAGS:
             if ex not in build_exclude:
                 build_exclude.append(ex)
@@ -1,8 +1,8 @@
 """
 Utilities to manage build tags
 """
+import os
 import sys
-import platform
 from invoke import task
 
 # ALL_TAGS lists any available build tag
@@ -34,25 +34,77 @@ PUPPY_TAGS = set([
     "zlib",
 ])
 
-LINUX_ONLY_TAGS = [
+LINUX_ONLY_TAGS = frozenset([
     "docker",
     "kubelet",
     "kubeapiserver",
     "cri",
     "containerd",
     "netcgo",
-]
+])
 
-REDHAT_AND_DEBIAN_ONLY_TAGS = [
+REDHAT_AND_DEBIAN_ONLY_TAGS = frozenset([
     "systemd",
-]
+])
 
-REDHAT_AND_DEBIAN_DIST = [
+REDHAT_AND_DEBIAN_DIST = frozenset([
     'debian',
     'ubuntu',
     'centos',
-    'redhat'
-]
+    'redhat',
+    'rhel',
+])
+
+
+def _get_distname():
+    """
+    Read the ID of the linux distribution from /etc/os-release, falling back
+    to the release files of older distributions that don't ship it (e.g.
+    CentOS/RHEL 6). Empty when it can't be found (e.g. not on linux).
+    """
+    distname = _read_release_key("/etc/os-release", "ID")
+    if distname:
+        return distname
+
+    try:
+        with open("/etc/redhat-release") as f:
+            release = f.readline().strip().lower()
+    except (IOError, OSError):
+        release = ""
+    if release.startswith("red hat"):
+        return "rhel"
+    if release:
+        # e.g. "CentOS release 6.10 (Final)"
+        return release.split()[0]
+
+    distname = _read_release_key("/etc/lsb-release", "DISTRIB_ID")
+    if distname:
+        return distname
+
+    if os.path.exists("/etc/debian_version"):
+        return "debian"
+    return ""
+
+
+def _read_release_key(path, key):
+    """
+    Return the lowercased value of `key` in the `path` KEY=value release file,
+    empty if the file or the key is missing
+    """
+    try:
+        with open(path) as f:
+            for line in f:
+                if line.startswith(key + "="):
+                    return line.split("=", 1)[1].strip().strip('"').lower()
+    except (IOError, OSError):
+        pass
+    return ""
+
+# name of the linux distribution the tasks are running on, only read once
+DISTNAME = _get_distname()
+
+# get_build_tags results, keyed by its (include, exclude) arguments
+_BUILD_TAGS_CACHE = {}
 
 
 def get_default_build_tags(puppy=False):
@@ -66,14 +118,13 @@ def get_default_build_tags(puppy=False):
         return PUPPY_TAGS
 
     include = ["all"]
-    exclude = [] if sys.platform.startswith('linux') else LINUX_ONLY_TAGS
+    exclude = set() if sys.platform.startswith('linux') else set(LINUX_ONLY_TAGS)
 
     # remove all tags that are only available on debian distributions
-    distname = platform.linux_distribution()[0].lower()
-    if distname not in REDHAT_AND_DEBIAN_DIST:
-        exclude = exclude + REDHAT_AND_DEBIAN_ONLY_TAGS
+    if DISTNAME not in REDHAT_AND_DEBIAN_DIST:
+        exclude |= REDHAT_AND_DEBIAN_ONLY_TAGS
 
-    return get_build_tags(include, exclude)
+    return get_build_tags(include, sorted(exclude))
 
 
 def get_build_tags(include, exclude):
@@ -81,14 +132,19 @@ def get_build_tags(include, exclude):
     Build the list of tags based on inclusions and exclusions passed through
     the command line
     """
-    # special case, include == all
-    if "all" in include:
-        return list(ALL_TAGS - set(exclude))
-
-    # filter out unrecognised tags
-    include = ALL_TAGS.intersection(set(include))
-    exclude = ALL_TAGS.intersection(set(exclude))
-    return list(include - exclude)
+    key = (tuple(include), tuple(exclude))
+    if key not in _BUILD_TAGS_CACHE:
+        # special case, include == all
+        if "all" in include:
+            _BUILD_TAGS_CACHE[key] = list(ALL_TAGS - set(exclude))
+        else:
+            # filter out unrecognised tags
+            include = ALL_TAGS.intersection(set(include))
+            exclude = ALL_TAGS.intersection(set(exclude))
+            _BUILD_TAGS_CACHE[key] = list(include - exclude)
+
+    # callers are free to modify the list they get
+    return list(_BUILD_TAGS_CACHE[key])
 
 
 @task
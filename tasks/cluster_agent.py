@@ -5,14 +5,13 @@ Cluster Agent tasks
 import os
 import glob
 import shutil
-from distutils.dir_util import copy_tree
 
 from invoke import task
 from invoke.exceptions import Exit
 
 from .build_tags import get_build_tags
 from .utils import get_build_flags, bin_name, get_version
-from .utils import REPO_PATH
+from .utils import REPO_PATH, copy_tree
 from .go import deps
 
 # constants
@@ -7,7 +7,6 @@ import os
 import shutil
 import sys
 import platform
-from distutils.dir_util import copy_tree
 
 import invoke
 from invoke import task
@@ -154,7 +154,7 @@ def pull_base_images(ctx, dockerfile, signed_pull=True):
     """
     Pulls the base images for a given Dockerfile, with
     content trust enabled by default, to ensure the base
-    images are signed
+    images are signed. Returns the names of the pulled images.
     """
     images = set()
     stages = set()
@@ -175,6 +175,9 @@ def pull_base_images(ctx, dockerfile, signed_pull=True):
         print("Ignoring intermediate stage names: {}".format(", ".join(stages)))
         images -= stages
 
+    # scratch is a reserved name, not an actual image
+    images.discard("scratch")
+
     print("Pulling following base images: {}".format(", ".join(images)))
 
     pull_env = {}
@@ -183,3 +186,5 @@ def pull_base_images(ctx, dockerfile, signed_pull=True):
 
     for i in images:
         ctx.run("docker pull {}".format(i), env=pull_env)
+
+    return images
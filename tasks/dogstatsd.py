@@ -6,7 +6,6 @@ from __future__ import print_function, absolute_import
 import os
 import sys
 import shutil
-from distutils.dir_util import copy_tree
 
 import invoke
 from invoke import task
@@ -14,7 +13,7 @@ from invoke.exceptions import Exit
 
 from .build_tags import get_build_tags, get_default_build_tags
 from .utils import get_build_flags, bin_name, get_root, load_release_versions, get_version
-from .utils import REPO_PATH
+from .utils import REPO_PATH, copy_tree
 
 from .go import deps
 
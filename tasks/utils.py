@@ -3,15 +3,24 @@ Miscellaneous functions, no tasks here
 """
 from __future__ import print_function
 
+import errno
 import os
 import platform
 import re
+import shutil
+import stat
 import sys
 import json
 from subprocess import check_output
 
 import invoke
 
+try:
+    from os import scandir
+except ImportError:
+    # python < 3.5, provided by the scandir backport
+    from scandir import scandir
+
 
 # constants
 ORG_PATH = "github.com/DataDog"
@@ -168,7 +177,18 @@ def get_git_branch_name():
     return check_output(["git", "rev-parse", "--abbrev-ref", "HEAD"]).decode('utf-8').strip()
 
 
+# query_version results, keyed by its arguments (but the context): git is only
+# asked once per task run
+_VERSION_CACHE = {}
+
 def query_version(ctx, git_sha_length=7, prefix=None):
+    key = (git_sha_length, prefix)
+    if key not in _VERSION_CACHE:
+        _VERSION_CACHE[key] = _query_version(ctx, git_sha_length, prefix)
+    return _VERSION_CACHE[key]
+
+
+def _query_version(ctx, git_sha_length=7, prefix=None):
     # The string that's passed in will look something like this: 6.0.0-beta.0-1-g4f19118
     # if the tag is 6.0.0-beta.0, it has been one commit since the tag and that commit hash is g4f19118
     cmd = "git describe --tags --candidates=50"
@@ -239,3 +259,52 @@ def load_release_versions(ctx, target_version):
             # environment when running a subprocess.
             return {str(k):str(v) for k, v in versions[target_version].items()}
     raise Exception("Could not find '{}' version in release.json".format(target_version))
+
+
+def copy_tree(src, dst):
+    """
+    Copy the content of the `src` folder into `dst`, preserving modes and
+    times. Directory entries come from scandir so their type and stat
+    information is only fetched once per file, files already up to date in
+    `dst` are skipped.
+
+    Replaces distutils' copy_tree, which stats every path again and is gone
+    from recent Python versions.
+    """
+    makedirs(dst)
+
+    for entry in scandir(src):
+        dst_path = os.path.join(dst, entry.name)
+        if entry.is_dir():
+            copy_tree(entry.path, dst_path)
+        elif entry.is_file():
+            st = entry.stat()
+            if is_up_to_date(st, dst_path):
+                continue
+            shutil.copyfile(entry.path, dst_path)
+            os.chmod(dst_path, stat.S_IMODE(st.st_mode))
+            os.utime(dst_path, (st.st_atime, st.st_mtime))
+
+
+def is_up_to_date(src_stat, dst):
+    """
+    Whether `dst` already holds a copy of the file `src_stat` describes, going
+    by size and modification time like rsync does
+    """
+    try:
+        dst_stat = os.stat(dst)
+    except OSError:
+        return False
+    return dst_stat.st_size == src_stat.st_size and dst_stat.st_mtime >= src_stat.st_mtime
+
+
+def makedirs(path):
+    """
+    Create `path` and its parents, unless it already exists
+    """
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        # another copy running concurrently might have created it already
+        if e.errno != errno.EEXIST:
+            raise